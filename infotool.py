@@ -1,7 +1,8 @@
 #!/usr/bin/python3
 # read and modify amiga info files
 
-import struct, png, sys, os
+import struct, png, sys, os, io, asyncio, collections, urllib.parse
+import contextlib, concurrent.futures, tarfile, functools, threading
 
 WB1_PALETTE = [
     (0, 85,170), (255,255,255), (0,0,34), (255,136,0),
@@ -176,6 +177,76 @@ IMAGE = [
     ( "NextImage", "L")
 ]
 
+def icon_scale(icon, sx, sy):
+    # nearest neighbour scaling by integer factors, done on the
+    # color indices before any palette is applied
+    if sx == 1 and sy == 1: return icon
+
+    scaled = []
+    for line in icon:
+        if sx != 1: line = [ p for p in line for i in range(sx) ]
+        scaled.extend([ line ] * sy)
+
+    return scaled
+
+# build a table mapping each stored pixel value of an image to the
+# RGB(A) bytes Workbench would display for it. Planes not selected by
+# PlanePick are filled from PlaneOnOff, the stored planes are assigned
+# to the selected ones in order
+@functools.lru_cache()
+def icon_table(wbver, depth, planepick, planeonoff, complement=False, transparent=False):
+    if wbver == 1: colors_wb = WB1_PALETTE
+    else:          colors_wb = WB2_PALETTE
+
+    # PlanePick and PlaneOnOff are stored as signed bytes
+    planepick &= 0xff
+    planeonoff &= 0xff
+
+    # depth of the resulting image, limited by the palette size
+    planes = max(depth, (planepick | planeonoff).bit_length())
+    planes = min(planes, (len(colors_wb)-1).bit_length())
+
+    table = [ ]
+    for value in range(1<<depth):
+        color = 0
+        plane = 0    # next stored plane
+        for p in range(planes):
+            if planepick & (1<<p):
+                if plane < depth and value & (1<<plane): color |= (1<<p)
+                plane += 1
+            elif planeonoff & (1<<p):
+                color |= (1<<p)
+
+        # select state of icons without own select image
+        if complement: color ^= (1<<planes)-1
+
+        pixel = bytes(colors_wb[color])
+        if transparent: pixel += bytes([ 0 if color == 0 else 255 ])
+        table.append(pixel)
+
+    return table
+
+def icon_png(file, img, icon, wbver, sx=1, sy=1, complement=False, transparent=False):
+    table = icon_table(wbver, img["Depth"], img["PlanePick"], img["PlaneOnOff"],
+                       complement, transparent)
+
+    # scale the color indices first, so the palette lookup
+    # below only runs over the final image
+    icon = icon_scale(icon, sx, sy)
+
+    # map whole rows to workbench colors at once. Icons mostly
+    # consist of repeated rows, so expanded rows are reused
+    rows = { }
+    wb_icon = [ ]
+    for line in icon:
+        key = bytes(line)
+        if not key in rows:
+            rows[key] = b"".join(map(table.__getitem__, line))
+        wb_icon.append(rows[key])
+
+    w = png.Writer(img["Width"]*sx, img["Height"]*sy, greyscale=False, alpha=transparent)
+    w.write(file, wb_icon)
+
 def icon_decode(image, data, name, wbver, options):
     img, data = parse_structure(image, IMAGE, data, options)
 
@@ -205,21 +276,16 @@ def icon_decode(image, data, name, wbver, options):
                     
     # write icon as PNG
     if name and options["export"]:
-        print("Exporting to",name+".png", "...")
-        # map all pixels to workbench colors
-        wb_icon = []
-        if wbver == 1: colors_wb = WB1_PALETTE
-        else:          colors_wb = WB2_PALETTE
-        for y in range(img["Height"]):
-            line = []
-            for x in range(img["Width"]):
-                line.extend(colors_wb[icon[y][x]])
+        # all requested sizes are derived from the same decoded icon
+        for scale in options["scales"]:
+            variants = [ ( scale, scale, "" ) ]
+            if options["aspect"]: variants.append( ( scale, 2*scale, "_aspect" ) )
 
-            wb_icon.append(line)
-
-        with open(name+'.png', 'wb') as f:
-            w = png.Writer(img["Width"], img["Height"], greyscale=False)
-            w.write(f, wb_icon)
+            for sx, sy, suffix in variants:
+                fname = name + ("" if scale == 1 else "_"+str(scale)+"x") + suffix + ".png"
+                print("Exporting to",fname, "...")
+                with open(fname, 'wb') as f:
+                    icon_png(f, img, icon, wbver, sx, sy, transparent=options["transparent"])
 
     # return the icon and the number of bytes used
     return (img, icon, data[picturesize:])
@@ -251,78 +317,83 @@ def parse_structure(prefix, structure, data, options):
                 
     return ( obj, data )
 
-# read an amiga info file
-def info_read(filename, options):
+# interpret the contents of an amiga info file
+def info_parse(data, basename, options):
     info = { }
-    
-    with open(filename, mode='rb') as file:
-        data = file.read()
 
-        # get base filename for PNG export
-        basename = os.path.splitext(os.path.basename(filename))[0]
+    # interpret start of file as diskobject
+    info["DiskObject"], data = parse_structure("DiskObject", DISKOBJECT, data, options)
 
-        # interpret start of file as diskobject
-        info["DiskObject"], data = parse_structure("DiskObject", DISKOBJECT, data, options)
+    # DrawerData needs to be present for WBDISK, WBDRAWER, WBGARBAGE
+    if info["DiskObject"]["DrawerData"]:
+        info["DrawerData"], data = parse_structure("DrawerData", DRAWERDATA, data, options)
 
-        # DrawerData needs to be present for WBDISK, WBDRAWER, WBGARBAGE
-        if info["DiskObject"]["DrawerData"]:
-            info["DrawerData"], data = parse_structure("DrawerData", DRAWERDATA, data, options)
+    # check which wb version we have
+    wb_ver = 1 if not info["DiskObject"]["Gadget"]["UserData"] else 2
 
-        # check which wb version we have
-        wb_ver = 1 if not info["DiskObject"]["Gadget"]["UserData"] else 2
+    # main icon
+    if info["DiskObject"]["Gadget"]["GadgetRender"]:
+        icon0, image, data = icon_decode("Icon", data, basename, wb_ver, options)
+        info["Icon"] = [ icon0, image ]
 
-        # main icon
-        if info["DiskObject"]["Gadget"]["GadgetRender"]:
-            icon0, image, data = icon_decode("Icon", data, basename, wb_ver, options)
-            info["Icon"] = [ icon0, image ]
+    # select icon
+    if info["DiskObject"]["Gadget"]["SelectRender"]:
+        icon1, image, data = icon_decode("IconSelect", data, basename and basename+"_select", wb_ver, options)
+        info["IconSelect"] = [ icon1, image ]
+            
+    if info["DiskObject"]["DefaultTool"]:
+        strlen = struct.unpack('>L', data[:4])[0]
+        str0 = data[4:4+strlen].decode("latin1").split("\x00")[0]
+        if not options["quiet"]:
+            print("DefaultTool=\""+str0+"\"")
+        info["DefaultTool"] = str0
+        data = data[4+strlen:]
+
+    if info["DiskObject"]["ToolTypes"]:
+        info["ToolTypes"] = []
+        
+        toollen = struct.unpack('>L', data[:4])[0]
 
-        # select icon
-        if info["DiskObject"]["Gadget"]["SelectRender"]:
-            icon1, image, data = icon_decode("IconSelect", data, basename+"_select", wb_ver, options)
-            info["IconSelect"] = [ icon1, image ]
-                
-        if info["DiskObject"]["DefaultTool"]:
+        data = data[4:]
+        toollen -= 4   # len itself counts as entry ...
+
+        # we expect the tool len to be a multiple of four
+        if toollen < 0 or toollen%4:
+            print("Warning: Tool list length must be four or multiple of four!!!")
+
+        # scan for strings
+        tool = 0
+        while toollen > 0:
             strlen = struct.unpack('>L', data[:4])[0]
             str0 = data[4:4+strlen].decode("latin1").split("\x00")[0]
             if not options["quiet"]:
-                print("DefaultTool=\""+str0+"\"")
-            info["DefaultTool"] = str0
+                print("ToolTypes["+str(tool)+"]=\""+str0+"\"")
+            info["ToolTypes"].append(str0)
             data = data[4+strlen:]
+            toollen -= 4
+            tool += 1
 
-        if info["DiskObject"]["ToolTypes"]:
-            info["ToolTypes"] = []
-            
-            toollen = struct.unpack('>L', data[:4])[0]
+    if info["DiskObject"]["Gadget"]["UserData"] and info["DiskObject"]["DrawerData"]:
+        # in OS2.x there's an additional flags and viewmodes for DrawerData
+        info["DrawerDataOS2"], data = parse_structure("DrawerDataOS2", DRAWERDATA_EXTRA_OS2, data, options)
+        
+    # check for unparsed data, keep it so callers know about it
+    if len(data):
+        print("Warning: Unparsed bytes:", len(data))
+        print(data)
+        info["Unparsed"] = data
 
-            data = data[4:]
-            toollen -= 4   # len itself counts as entry ...
+    return info
 
-            # we expect the tool len to be a multiple of four
-            if toollen < 0 or toollen%4:
-                print("Warning: Tool list length must be four or multiple of four!!!")
+# read an amiga info file
+def info_read(filename, options):
+    with open(filename, mode='rb') as file:
+        data = file.read()
 
-            # scan for strings
-            tool = 0
-            while toollen > 0:
-                strlen = struct.unpack('>L', data[:4])[0]
-                str0 = data[4:4+strlen].decode("latin1").split("\x00")[0]
-                if not options["quiet"]:
-                    print("ToolTypes["+str(tool)+"]=\""+str0+"\"")
-                info["ToolTypes"].append(str0)
-                data = data[4+strlen:]
-                toollen -= 4
-                tool += 1
-
-        if info["DiskObject"]["Gadget"]["UserData"] and info["DiskObject"]["DrawerData"]:
-            # in OS2.x there's an additional flags and viewmodes for DrawerData
-            info["DrawerDataOS2"], data = parse_structure("DrawerDataOS2", DRAWERDATA_EXTRA_OS2, data, options)
-            
-        # check for unparsed data
-        if len(data):
-            print("Warning: Unparsed bytes:", len(data))
-            print(data)
+    # get base filename for PNG export
+    basename = os.path.splitext(os.path.basename(filename))[0]
 
-    return info
+    return info_parse(data, basename, options)
 
 def write_structure(file, structure, data):
     LEN = { 'L':4, 'H':2, 'B':1, 'l':4, 'h':2, 'b':1 }
@@ -335,11 +406,12 @@ def write_structure(file, structure, data):
             # export sub-structure
             write_structure(file, item[1], data[item[0]])
 
-def write_icon(file, icon):
+def write_icon(file, icon, mark=None):
     img, data = icon
     
     # write image header
     write_structure(file, IMAGE, img)
+    if mark: mark("data")
 
     # calculate icon data size
     row_bytes = ((img["Width"] + 15) >> 4) << 1  # size in bytes of a row of pixel
@@ -360,39 +432,55 @@ def write_icon(file, icon):
                 
                 file.write(bytes([byte]))
 
+# write the info into a file like object. If a layout list is given
+# it receives the start offset of every structure written
+def info_serialize(file, info, layout=None):
+    def mark(name):
+        if layout is not None: layout.append((file.tell(), name))
+
+    # write the disk object structure
+    mark("DiskObject")
+    write_structure(file, DISKOBJECT, info["DiskObject"])
+
+    # write the DrawerData if present
+    if "DrawerData" in info:
+        mark("DrawerData")
+        write_structure(file, DRAWERDATA, info["DrawerData"])
+    
+    # write the icons
+    for name in [ "Icon", "IconSelect" ]:
+        if name in info:
+            mark(name)
+            write_icon(file, info[name], lambda n: mark(name+" "+n))
+
+    if  info["DiskObject"]["DefaultTool"]:
+        if "DefaultTool" in info:
+            mark("DefaultTool")
+            s = info["DefaultTool"].encode("latin1")+b'\x00'
+            file.write(struct.pack('>L', len(s))+s)
+    
+    # append tooltypes
+    if info["DiskObject"]["ToolTypes"]:
+        if "ToolTypes" in info:
+            mark("ToolTypes")
+            file.write(struct.pack('>L', (len(info["ToolTypes"])+1)*4))
+            for i, t in enumerate(info["ToolTypes"]):
+                mark("ToolTypes["+str(i)+"]")
+                s = t.encode("latin1")+b'\x00'
+                file.write(struct.pack('>L', len(s))+s)
+        
+    # write OS2.x DrawerData
+    if "DrawerData" in info and info["DiskObject"]["Gadget"]["UserData"]:
+        if "DrawerDataOS2" in info:
+            mark("DrawerDataOS2")
+            write_structure(file, DRAWERDATA_EXTRA_OS2, info["DrawerDataOS2"])
+
 def info_write(filename, info):
     if filename and info and "DiskObject" in info:
         print("Writing", filename)
         
         with open(filename, mode='wb') as file:
-            # write the disk object structure
-            write_structure(file, DISKOBJECT, info["DiskObject"])
-
-            # write the DrawerData if present
-            if "DrawerData" in info:
-                write_structure(file, DRAWERDATA, info["DrawerData"])
-            
-            # write the icons
-            if "Icon"       in info: write_icon(file, info["Icon"])
-            if "IconSelect" in info: write_icon(file, info["IconSelect"])
-
-            if  info["DiskObject"]["DefaultTool"]:
-                if "DefaultTool" in info:
-                    s = info["DefaultTool"].encode("latin1")+b'\x00'
-                    file.write(struct.pack('>L', len(s))+s)
-            
-            # append tooltypes
-            if info["DiskObject"]["ToolTypes"]:
-                if "ToolTypes" in info:
-                    file.write(struct.pack('>L', (len(info["ToolTypes"])+1)*4))
-                    for t in info["ToolTypes"]:                    
-                        s = t.encode("latin1")+b'\x00'
-                        file.write(struct.pack('>L', len(s))+s)
-                
-            # write OS2.x DrawerData
-            if "DrawerData" in info and info["DiskObject"]["Gadget"]["UserData"]:
-                if "DrawerDataOS2" in info:
-                    write_structure(file, DRAWERDATA_EXTRA_OS2, info["DrawerDataOS2"])
+            info_serialize(file, info)
 
 def update_icon(image, filename):
     try:
@@ -473,6 +561,10 @@ def update_icon(image, filename):
         print("ok, mapping to",image[0]["Depth"],"Workbench 2.x color bits with color offset", dist_wb2)
         if dist_wb2 > 1000: print("Warning, significant color offset")
         image[1] = icon_wb2
+
+    # the new image data always contains all planes
+    image[0]["PlanePick"] = (1 << image[0]["Depth"]) - 1
+    image[0]["PlaneOnOff"] = 0
         
     return True
     
@@ -705,11 +797,380 @@ def info_check(info):
     
     return True
 
+# a small LRU cache, entries are dropped in least recently used order
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        if not key in self.entries: return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+# render one of the icons of an info file into a PNG in memory
+def info_render(info, select, wbver, scale, transparent=False):
+    # without select image Workbench highlights by complementing the icon
+    complement = select and not "IconSelect" in info
+    name = "IconSelect" if select and not complement else "Icon"
+    if not name in info or not info[name][1]:
+        return None
+
+    img, icon = info[name]
+    f = io.BytesIO()
+    icon_png(f, img, icon, wbver, scale, scale, complement, transparent)
+    return f.getvalue()
+
+class RenderServer:
+    # the caches are only accessed from the event loop thread, the
+    # executor threads just parse and render
+    def __init__(self, root, size=1024):
+        self.root = os.path.realpath(root)
+        self.infos = LRUCache(size)   # path -> (mtime, info)
+        self.pngs = LRUCache(size)    # (path, mtime, options) -> png
+        self.parsing = { }            # parses currently in progress
+        self.pending = { }            # renders currently in progress
+        self.quiet = threading.Lock() # serializes stdout redirection
+
+    def parse(self, path):
+        with open(path, mode='rb') as file:
+            data = file.read()
+
+        # the parser reports problems on stdout, ignore these. Stdout is
+        # shared by all threads, so only one may redirect it at a time
+        with self.quiet, contextlib.redirect_stdout(io.StringIO()):
+            return info_parse(data, None, { "quiet": True, "export": False })
+
+    async def load(self, path, mtime):
+        entry = self.infos.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+
+        # all renders of one file share a single parse
+        key = (path, mtime)
+        future = self.parsing.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, self.parse, path)
+            future.add_done_callback(lambda f: self.parsed(key, f))
+            self.parsing[key] = future
+
+        return await asyncio.shield(future)
+
+    def parsed(self, key, future):
+        del self.parsing[key]
+        if not future.cancelled() and not future.exception():
+            self.infos.put(key[0], (key[1], future.result()))
+
+    async def render(self, path, mtime, select, wbver, scale, transparent):
+        info = await self.load(path, mtime)
+        if wbver is None:
+            wbver = 1 if not info["DiskObject"]["Gadget"]["UserData"] else 2
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, info_render, info, select, wbver, scale, transparent)
+
+    async def get(self, path, select, wbver, scale, transparent):
+        # cache entries are bound to the files modification time, so
+        # changed files are automatically picked up again
+        mtime = os.stat(path).st_mtime_ns
+        key = (path, mtime, select, wbver, scale, transparent)
+
+        data = self.pngs.get(key)
+        if data is not None: return data
+
+        # identical requests share a single render
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.render(path, mtime, select, wbver, scale, transparent))
+            future.add_done_callback(lambda f: self.done(key, f))
+            self.pending[key] = future
+
+        return await asyncio.shield(future)
+
+    def done(self, key, future):
+        del self.pending[key]
+        if not future.cancelled() and not future.exception() and future.result() is not None:
+            self.pngs.put(key, future.result())
+
+    def request(self, target):
+        # translate request url into a file path and render options
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+
+        path = os.path.realpath(os.path.join(self.root, urllib.parse.unquote(url.path).lstrip("/")))
+        if os.path.commonpath([ self.root, path ]) != self.root:
+            raise ValueError("Path outside of served directory")
+
+        select = query.get("select", [ "0" ])[0] not in [ "0", "" ]
+
+        palette = query.get("palette", [ None ])[0]
+        if palette is None:    wbver = None
+        elif palette == "wb1": wbver = 1
+        elif palette == "wb2": wbver = 2
+        else: raise ValueError("Unknown palette "+palette)
+
+        scale = int(query.get("scale", [ "1" ])[0])
+        if scale < 1 or scale > 16:
+            raise ValueError("Scale out of range")
+
+        transparent = query.get("transparent", [ "0" ])[0] not in [ "0", "" ]
+
+        return path, select, wbver, scale, transparent
+
+    async def reply(self, writer, status, ctype, body, keep_alive):
+        writer.write(("HTTP/1.1 "+status+"\r\n"+
+                      "Content-Type: "+ctype+"\r\n"+
+                      "Content-Length: "+str(len(body))+"\r\n"+
+                      "Connection: "+("keep-alive" if keep_alive else "close")+"\r\n"+
+                      "\r\n").encode("latin1") + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                    if not line: break
+
+                    # read and ignore headers except for the connection state
+                    keep_alive = line.rstrip().endswith(b"HTTP/1.1")
+                    while True:
+                        header = await reader.readline()
+                        if header in [ b"\r\n", b"\n", b"" ]: break
+                        key, _, value = header.decode("latin1").partition(":")
+                        if key.strip().lower() == "connection":
+                            keep_alive = value.strip().lower() == "keep-alive"
+                except ValueError:
+                    # request or header line exceeds the stream limit
+                    await self.reply(writer, "400 Bad Request", "text/plain", b"Request too long\n", False)
+                    break
+
+                status, ctype, body = await self.respond(line.decode("latin1").split())
+                await self.reply(writer, status, ctype, body, keep_alive)
+
+                if not keep_alive: break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request):
+        if len(request) != 3:
+            return "400 Bad Request", "text/plain", b"Bad request\n"
+
+        if request[0] != "GET":
+            return "405 Method Not Allowed", "text/plain", b"Only GET is supported\n"
+
+        try:
+            path, select, wbver, scale, transparent = self.request(request[1])
+            if not path.lower().endswith(".info"):
+                return "404 Not Found", "text/plain", b"Not an info file\n"
+
+            data = await self.get(path, select, wbver, scale, transparent)
+        except (ValueError, IndexError) as e:
+            return "400 Bad Request", "text/plain", (str(e)+"\n").encode("latin1")
+        except OSError:
+            return "404 Not Found", "text/plain", b"No such file\n"
+        except struct.error as e:
+            return "422 Unprocessable Entity", "text/plain", ("Invalid info file: "+str(e)+"\n").encode("latin1")
+        except Exception as e:
+            return "500 Internal Server Error", "text/plain", (str(e)+"\n").encode("latin1")
+
+        if data is None:
+            return "404 Not Found", "text/plain", b"No icon image present\n"
+
+        return "200 OK", "image/png", data
+
+# serve rendered icons via http on a tcp port or a unix socket
+def serve(address, root):
+    server = RenderServer(root)
+
+    async def main():
+        if ":" in address or address.isdigit():
+            host, _, port = address.rpartition(":")
+            s = await asyncio.start_server(server.handle, host or "localhost", int(port))
+        else:
+            s = await asyncio.start_unix_server(server.handle, address)
+
+        print("Serving", server.root, "on", address)
+        async with s:
+            await s.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+# read and re-serialize a single info file and compare the result
+# with the original. Returns None if both are identical, otherwise
+# the first differing offset, its owner and the class of the mismatch
+def roundtrip_file(filename):
+    try:
+        with open(filename, mode='rb') as file:
+            data = file.read()
+    except OSError as e:
+        return ( 0, "read error: "+str(e), "read error" )
+
+    layout = [ ]
+    output = io.BytesIO()
+
+    # parser and writer report problems on stdout, ignore these
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            info = info_parse(data, None, { "quiet": True, "export": False })
+        except Exception as e:
+            return ( 0, "parse error: "+str(e), "parse error" )
+
+        try:
+            info_serialize(output, info, layout)
+        except Exception as e:
+            owner = layout[-1][1] if layout else "DiskObject"
+            return ( output.tell(), owner+": "+str(e), owner.split("[")[0]+": serialize error" )
+
+    output = output.getvalue()
+    if output == data: return None
+
+    # search first differing byte
+    offset = min(len(data), len(output))
+    for i in range(offset):
+        if data[i] != output[i]:
+            offset = i
+            break
+
+    # find the structure which owns this offset
+    owner = "tail data"
+    for start, name in layout:
+        if start <= offset < len(output): owner = name
+
+    if offset == len(output):
+        kind = "bytes dropped"
+    elif offset == len(data):
+        kind = "bytes added"
+    else:
+        kind = "bytes differ"
+
+    return ( offset, owner, owner.split("[")[0]+": "+kind )
+
+def roundtrip_worker(filename):
+    return ( filename, roundtrip_file(filename) )
+
+# check all info files below directory using a pool of worker processes
+def roundtrip_check(directory, jobs=None):
+    # os.walk silently yields nothing for a missing directory
+    if not os.path.isdir(directory):
+        print("Error: No such directory", directory)
+        return False
+
+    files = [ ]
+    for path, dirs, names in os.walk(directory):
+        dirs.sort()
+        for n in sorted(names):
+            if n.lower().endswith(".info"):
+                files.append(os.path.join(path, n))
+
+    classes = collections.Counter()
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        for filename, result in pool.map(roundtrip_worker, files, chunksize=16):
+            if result:
+                offset, owner, cls = result
+                print(filename+": differs at offset", hex(offset), "("+owner+")")
+                classes[cls] += 1
+
+    print("Checked", len(files), "files,", sum(classes.values()), "mismatches")
+    for cls, count in classes.most_common():
+        print("  ", count, cls)
+
+    return not classes
+
+# modify a single info file held in memory
+def info_modify(data, values):
+    info = info_parse(data, None, { "quiet": True, "export": False })
+    if not info_check(info): return None
+
+    # unparsed bytes would be lost when writing the file again
+    if "Unparsed" in info:
+        print("Error: File contains unparsed bytes")
+        return None
+
+    for value in values:
+        print("Applying", value, "... ", end="")
+        if not apply(info, value): return None
+
+    if not info_check(info):
+        print("Check failed: Not saving file")
+        return None
+
+    output = io.BytesIO()
+    info_serialize(output, info)
+    return output.getvalue()
+
+# info files larger than this are passed through by tar_filter
+TAR_MAX_INFO_SIZE = 256*1024
+
+# read a tar stream, apply the values to every info file contained
+# and write the resulting tar stream. Members are processed one by
+# one and not remembered, so the whole archive is never held in memory
+def tar_filter(values, fin, fout):
+    ok = True
+    try:
+        with tarfile.open(fileobj=fin, mode="r|*") as tin, \
+             tarfile.open(fileobj=fout, mode="w|", format=tarfile.PAX_FORMAT) as tout:
+            member = tin.next()
+            while member is not None:
+                if ( not values or not member.isfile() or
+                     not member.name.lower().endswith(".info") ):
+                    tout.addfile(member, tin.extractfile(member) if member.isfile() else None)
+                elif member.size > TAR_MAX_INFO_SIZE:
+                    # real icons are tiny, don't load huge members into memory
+                    print("Error: Keeping", member.name, "unmodified, size exceeds", TAR_MAX_INFO_SIZE, "bytes")
+                    tout.addfile(member, tin.extractfile(member))
+                    ok = False
+                else:
+                    data = tin.extractfile(member).read()
+                    print("Filtering", member.name)
+                    try:
+                        output = info_modify(data, values)
+                    except Exception as e:
+                        print("Error:", str(e))
+                        output = None
+
+                    if output is None:
+                        print("Error: Keeping", member.name, "unmodified")
+                        output = data
+                        ok = False
+
+                    member.size = len(output)
+                    tout.addfile(member, io.BytesIO(output))
+
+                # tarfile keeps a list of all members seen otherwise
+                tin.members.clear()
+                tout.members.clear()
+                member = tin.next()
+    except tarfile.TarError as e:
+        print("Error: Unable to process tar stream:", str(e))
+        return False
+
+    return ok
+
 def usage():
     print("Usage: infotool.py [options] <infofile> [values... <outfile>]")
+    print("       infotool.py serve <[host:]port|socket> [directory]")
+    print("       infotool.py roundtrip-check <directory> [jobs]")
+    print("       infotool.py tar-filter [values...] < in.tar > out.tar")
     print("Options:")
     print("     -e     export the embedded icons as PNGs")
     print("     -q     quiet, don't list the info file contents")
+    print("     -s<n,...>  export the icons at the given integer scales, e.g. -s1,2,4")
+    print("     -a     additionally export icons with doubled height to")
+    print("            correct the pixel aspect of hires icons")
+    print("     -t     export icons with transparent background color")
     print("Values... is a list of key=value pairs to be modified.")
     print("        like e.g. DiskObject:Gadget:LeftEdge=100")
     print("   Special values are Icon, IconSelect, DefaultTool and ToolTypes")
@@ -720,34 +1181,78 @@ def usage():
     print("       DefaultTool=\"SYS:MyTool\"")
     print("     - ToolTypes can be used to set one ToolTypes string like")
     print("       ToolTypes[10]=\"Hello World\"")
+    print("The serve command renders the icons of all info files below")
+    print("directory as PNGs via http like e.g.")
+    print("       http://localhost:8000/Prefs/Pointer.info?select=1&palette=wb2&scale=2&transparent=1")
+    print("The roundtrip-check command reads and rewrites all info files")
+    print("below directory in memory and reports files which change.")
+    print("The tar-filter command applies the values to all info files")
+    print("of a tar stream read from stdin and writes the result to stdout.")
     
     sys.exit(0)
 
-index = 1
-options = { "quiet": False, "export": False }
-while index < len(sys.argv) and sys.argv[index][0] == "-":
-    if sys.argv[index][1:] == "e": options["export"] = True
-    elif sys.argv[index][1:] == "q": options["quiet"] = True
-    else:
-        print("Unknown option", sys.argv[index])
-        sys.exit(-1)
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        serve(sys.argv[2], sys.argv[3] if len(sys.argv) >= 4 else ".")
+        sys.exit(0)
 
-    index = index + 1
-        
-if index >= len(sys.argv):
-    usage()
+    if len(sys.argv) >= 3 and sys.argv[1] == "roundtrip-check":
+        jobs = None
+        if len(sys.argv) >= 4:
+            try:
+                jobs = int(sys.argv[3])
+            except ValueError:
+                jobs = 0
+
+            if jobs < 1:
+                print("Invalid number of jobs", sys.argv[3])
+                sys.exit(-1)
+
+        ok = roundtrip_check(sys.argv[2], jobs)
+        sys.exit(0 if ok else -1)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "tar-filter":
+        # stdout carries the tar stream, so all messages go to stderr
+        fout = sys.stdout.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            ok = tar_filter(sys.argv[2:], sys.stdin.buffer, fout)
+        sys.exit(0 if ok else -1)
+
+    index = 1
+    options = { "quiet": False, "export": False, "scales": [ 1 ], "aspect": False, "transparent": False }
+    while index < len(sys.argv) and sys.argv[index][0] == "-":
+        if sys.argv[index][1:] == "e": options["export"] = True
+        elif sys.argv[index][1:] == "q": options["quiet"] = True
+        elif sys.argv[index][1:] == "a": options["aspect"] = True
+        elif sys.argv[index][1:] == "t": options["transparent"] = True
+        elif sys.argv[index][1:2] == "s":
+            try:
+                options["scales"] = [ int(v) for v in sys.argv[index][2:].split(",") ]
+            except ValueError:
+                options["scales"] = [ ]
 
-info = info_read(sys.argv[index], options)
+            if not options["scales"] or min(options["scales"]) < 1:
+                print("Invalid scale list", sys.argv[index])
+                sys.exit(-1)
+        else:
+            print("Unknown option", sys.argv[index])
+            sys.exit(-1)
 
-if info_check(info) and len(sys.argv[index:]) >= 2:
-    for m in range(len(sys.argv[index:])-2):
-        print("Applying", sys.argv[index+1+m], "... ", end="")
-        if not apply(info, sys.argv[index+1+m]):
-            sys.exit(-1)            
+        index = index + 1
+        
+    if index >= len(sys.argv):
+        usage()
 
-    if not info_check(info):
-        print("Check failed: Not saving file")
-        sys.exit(-1)            
-    else:
-        info_write(sys.argv[-1], info)
+    info = info_read(sys.argv[index], options)
+
+    if info_check(info) and len(sys.argv[index:]) >= 2:
+        for m in range(len(sys.argv[index:])-2):
+            print("Applying", sys.argv[index+1+m], "... ", end="")
+            if not apply(info, sys.argv[index+1+m]):
+                sys.exit(-1)            
 
+        if not info_check(info):
+            print("Check failed: Not saving file")
+            sys.exit(-1)            
+        else:
+            info_write(sys.argv[-1], info)